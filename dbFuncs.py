@@ -1,10 +1,133 @@
 import datetime
+import io
 import json
 import os
+import re
 import csv
 import zipfile
+import itertools
+import shutil
 import mysql.connector
 import tempfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from contextlib import contextmanager
+from mysql.connector import pooling
+
+# orjson is optional, it speeds up reading and writing the table structure of large databases
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# number of connections kept open in each DBConn pool
+POOL_SIZE = 10
+
+# number of tables dumped in parallel by createDataBackup, each worker holds one pooled connection
+BACKUP_WORKERS = 8
+# number of table dumps queued, running or waiting to be written to the archive at any time
+BACKUP_MAX_PENDING = 2 * BACKUP_WORKERS
+# size in bytes a table dump is held in memory before it is moved to a temporary file
+BACKUP_SPOOL_SIZE = 16 * 1024 * 1024
+# queries which change the database structure and invalidate the cached structure
+_DDL_RE = re.compile(r'\s*(ALTER|CREATE|DROP|RENAME)\b', re.IGNORECASE)
+# characters allowed in a quoted identifier: any BMP character other than NUL, at most 64 characters
+_IDENTIFIER_RE = re.compile('[\u0001-\uffff]{1,64}')
+# size in bytes of the blocks written to the compressor for each backup archive entry
+ZIP_WRITE_BUFFER_SIZE = 256 * 1024
+# version string of MariaDB servers, e.g. 10.6.12-MariaDB
+_MARIADB_VERSION_RE = re.compile(r'(\d+)\.(\d+)\.(\d+)-MariaDB', re.IGNORECASE)
+# number of rows sent in each multi-row INSERT statement when restoring a backup
+INSERT_BATCH_SIZE = 1000
+# maximum number of placeholders the server accepts in one prepared statement
+PREPARED_PARAM_LIMIT = 65535
+# column types restored from backup CSV text as python numbers
+_INT_TYPE_RE = re.compile(r'(tinyint|smallint|mediumint|int|integer|bigint)\b', re.IGNORECASE)
+_FLOAT_TYPE_RE = re.compile(r'(float|double|real)\b', re.IGNORECASE)
+
+
+def quoteIdentifier(name: str) -> str:
+    """
+    Quote a table or column name for use in a query.  Raises ValueError if the name is not a valid MySQL identifier.
+    """
+    if not _IDENTIFIER_RE.fullmatch(name) or name.endswith(' '):
+        raise ValueError(f'Invalid identifier: {name!r}')
+    return '`' + name.replace('`', '``') + '`'
+
+
+def quoteString(valIn: str) -> str:
+    """ Quote a value as a string literal for use in a query. """
+    return "'" + valIn.replace('\\', '\\\\').replace("'", "''") + "'"
+
+
+def unquoteColumnDefault(valIn):
+    """
+    Convert a MariaDB 10.2.7+ information_schema column default to the SHOW COLUMNS format.  Literal defaults are
+    unquoted and the string 'NULL' (no default) becomes None.  Expressions such as current_timestamp() are kept.
+    """
+    if valIn is None or valIn == 'NULL':
+        return None
+    if len(valIn) >= 2 and valIn[0] == "'" and valIn[-1] == "'":
+        return valIn[1:-1].replace("''", "'")
+    return valIn
+
+
+if orjson is not None:
+    jsonDumps = orjson.dumps
+    jsonLoads = orjson.loads
+else:
+    def jsonDumps(objIn) -> bytes:
+        """ Serialize an object to UTF-8 encoded JSON bytes, like orjson.dumps. """
+        return json.dumps(objIn).encode('utf-8')
+
+    jsonLoads = json.loads
+
+
+def decodeBytes(valIn):
+    """ Decode a bytes or bytearray value to a str, keeping None. """
+    return None if valIn is None else valIn.decode("utf-8")
+
+
+def keepValue(valIn):
+    """ Return a str or None value unchanged. """
+    return valIn
+
+
+def stringifyValue(valIn):
+    """ Convert any other value to a str, keeping None. """
+    return None if valIn is None else str(valIn)
+
+
+def columnDecoders(rows: list) -> list:
+    """
+    Choose, once per column, the function converting the values returned by the connector for a text column
+    (str, bytes or bytearray) to a str or None.  The choice is based on the first non-None value of each column, as
+    the connector returns the same type for every row of a column.
+    :return: A list with one decoder function per column of the rows.
+    """
+    if len(rows) == 0:
+        return []
+    decoders = []
+    for colId in range(len(rows[0])):
+        sample = next((row[colId] for row in rows if row[colId] is not None), None)
+        if isinstance(sample, (bytes, bytearray)):
+            decoders.append(decodeBytes)
+        elif sample is None or isinstance(sample, str):
+            decoders.append(keepValue)
+        else:
+            decoders.append(stringifyValue)
+    return decoders
+
+
+def csvValueConverter(colType: str):
+    """
+    Return a function converting the CSV text of a backup value to the python type matching the column type.
+    Empty values of numeric columns become None, since NULL values are written to the backup as empty fields.
+    """
+    if _INT_TYPE_RE.match(colType):
+        return lambda valIn: int(valIn) if valIn != '' else None
+    if _FLOAT_TYPE_RE.match(colType):
+        return lambda valIn: float(valIn) if valIn != '' else None
+    return str
 
 
 class DBConn:
@@ -13,7 +136,7 @@ class DBConn:
     """
 
     def __init__(self, host: str, user: str, passwd: str, db: str, port: int, auth_plugin: str):
-        """ Initialize the database connection using the provided data """
+        """ Initialize the database connection pool using the provided data """
         self.connCreds = {
             'host': host,
             'user': user,
@@ -22,36 +145,73 @@ class DBConn:
             'port': port,
             'auth_plugin': auth_plugin
         }
-        self.conn = self.createConn(modeSet=False)
         self.database = self.connCreds['db']
+        # result of getCurrentDBStructure(), cleared whenever the structure is changed through this instance
+        self._structureCache = None
+        # whether information_schema quotes column defaults, see hasQuotedColumnDefaults()
+        self._quotedDefaults = None
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name='jsondb',
+            pool_size=POOL_SIZE,
+            # ordinary queries leave no session state behind, so skip the reset on every return to the pool.
+            # Callers that change session state use resetConn() instead.
+            pool_reset_session=False,
+            **self.connectArgs()
+        )
 
-    def createConn(self, modeSet=True):
+    def connectArgs(self, **overrides) -> dict:
         """
-        Create a new database connection.  If modeSet is True, the instance connection variable is set. If false, the
-        connection variable is returned
+        Build the keyword arguments passed to mysql.connector for a new connection.
+        :param overrides: Extra connection options which replace or extend the defaults.
         """
-        connTmp = mysql.connector.connect(
-            host=self.connCreds['host'],
-            user=self.connCreds['user'],
-            password=self.connCreds['passwd'],
-            database=self.connCreds['db'],
-            port=self.connCreds['port'],
-            auth_plugin=self.connCreds['auth_plugin']
-        )
-        connTmp.autocommit = True
-        if modeSet:
-            self.conn = connTmp
-        return connTmp
+        args = {
+            'host': self.connCreds['host'],
+            'user': self.connCreds['user'],
+            'password': self.connCreds['passwd'],
+            'database': self.connCreds['db'],
+            'port': self.connCreds['port'],
+            'auth_plugin': self.connCreds['auth_plugin'],
+            'autocommit': True
+        }
+        args.update(overrides)
+        return args
+
+    def createConn(self, **overrides):
+        """
+        Create a new database connection outside of the pool.  The caller is responsible for closing it.
+        :param overrides: Extra connection options, see connectArgs()
+        """
+        return mysql.connector.connect(**self.connectArgs(**overrides))
 
-    def getConn(self):
+    @contextmanager
+    def getConn(self, **overrides):
         """
-        Fetch a connection from the pool.
+        Fetch a connection from the pool for a single unit of work.  The connection is returned to the pool when the
+        with block exits.
+        :param overrides: Extra connection options, see connectArgs().  If provided, a standalone connection with
+        these options is created instead of using the pool, and closed when the with block exits.
         :return: tuple: (connection, cursor)
         """
-        if not self.conn.is_connected():
-            self.conn.close()
-            self.createConn()
-        return self.conn, self.conn.cursor()
+        conn = self.createConn(**overrides) if overrides else self.pool.get_connection()
+        cur = conn.cursor()
+        try:
+            yield conn, cur
+        finally:
+            cur.close()
+            conn.close()
+
+    @staticmethod
+    def resetConn(conn):
+        """
+        Reset the session state of a connection (variables, autocommit, open transactions) without paying for a new
+        handshake and authentication.  Falls back to reconnecting if the connection was dropped.
+        """
+        try:
+            resetDone = conn.cmd_reset_connection() is not False
+        except mysql.connector.errors.Error:
+            resetDone = False
+        if not resetDone:
+            conn.reconnect(attempts=3, delay=0)
 
     def dbSelect(self, query, data=()):
         """
@@ -59,15 +219,27 @@ class DBConn:
 
         :param query: The query string. Format: using %s as a placeholder for variables.  No quotes around %s.
         :param data: Iterable , even if there is only one value.  Data for placeholders in the query.
+        :return: A list of dicts in format: {colName: value}, one per row.
         """
-        dbc = self.getConn()
-        if len(data) == 0:
-            dbc[1].execute(query)
-        else:
-            dbc[1].execute(query, data)
-        selectedFields = [item[0] for item in dbc[1].description]
-        selectedData = dbc[1].fetchall()
-        return [{selectedFields[colId]:row[colId] for colId in range(len(selectedFields))} for row in selectedData]
+        selectedFields, selectedData = self.dbSelectTuples(query, data)
+        return [dict(zip(selectedFields, row)) for row in selectedData]
+
+    def dbSelectTuples(self, query, data=()):
+        """
+        Select data from a database, without building a dict for each row.
+
+        :param query: The query string. Format: using %s as a placeholder for variables.  No quotes around %s.
+        :param data: Iterable , even if there is only one value.  Data for placeholders in the query.
+        :return: tuple: (list of column names, list of row tuples)
+        """
+        with self.getConn() as (conn, cur):
+            if len(data) == 0:
+                cur.execute(query)
+            else:
+                cur.execute(query, data)
+            selectedFields = [item[0] for item in cur.description]
+            selectedData = cur.fetchall()
+        return selectedFields, selectedData
 
     def dbQuery(self, query: str, data=()):
         """
@@ -76,24 +248,39 @@ class DBConn:
         :param query: The query string.  Format: "VALUES (%s, %s)" where %s is a placeholder.
         :param data: Tuple, even if there is only one value.  Data for placeholders in the query.
         """
-        dbc = self.getConn()
-        if len(data) == 0:
-            dbc[1].execute(query)
-        else:
-            dbc[1].execute(query, data)
+        with self.getConn() as (conn, cur):
+            if len(data) == 0:
+                cur.execute(query)
+            else:
+                cur.execute(query, data)
+        if _DDL_RE.match(query):
+            self._structureCache = None
+
+    @contextmanager
+    def dbStream(self, query, data=()):
+        """
+        Run a select query and stream the result rows from the server instead of loading them all into memory.
+
+        :param query: The query string. Format: using %s as a placeholder for variables.  No quotes around %s.
+        :param data: Iterable , even if there is only one value.  Data for placeholders in the query.
+        :return: tuple: (list of column names, iterator of row tuples).  Rows must be read inside the with block.
+        """
+        with self.getConn() as (conn, cur):
+            if len(data) == 0:
+                cur.execute(query)
+            else:
+                cur.execute(query, data)
+            try:
+                yield [item[0] for item in cur.description], iter(cur)
+            finally:
+                # discard any rows the caller did not read so the connection can be reused
+                if conn.unread_result:
+                    conn.consume_results()
 
     def fetchTableList(self) -> list:
         """ Return a list of table name strings from this database. """
-        dbc = self.getConn()
-        dbc[1].execute("SHOW TABLES;")
-        tList = dbc[1].fetchall()
-        tNamesOut = []
-        for row in tList:
-            if isinstance(row[0], str):
-                tNamesOut.append(row[0])
-            else:
-                tNamesOut.append(bytes(row[0]).decode("utf-8"))
-        return tNamesOut
+        tList = self.dbSelectTuples("SHOW TABLES;")[1]
+        return [row[0].decode("utf-8") if isinstance(row[0], (bytes, bytearray)) else row[0] for row in tList]
 
     def getTableColumns(self, tableName: str) -> dict:
         """
@@ -101,134 +288,288 @@ class DBConn:
         Raises mysql.connector.errors.ProgrammingError if the table does not exist.
         :return: A dict in format: {colName, colType}
         """
-        def decodeDefault(valIn):
-            if isinstance(valIn, bytes):
-                return valIn.decode("utf-8")
-            elif isinstance(valIn, str):
-                return valIn
-            elif valIn is None:
-                return None
-            return str(valIn)
-
-        getTable = self.dbSelect(f'SHOW COLUMNS FROM `{tableName}`;')
+        # row format: (Field, Type, Null, Key, Default, Extra)
+        getTable = self.dbSelectTuples(f'SHOW COLUMNS FROM {quoteIdentifier(tableName)};')[1]
+        dField, dType, dNull, dKey, dDefault, dExtra = columnDecoders(getTable) or [keepValue] * 6
         return {
-            str(col['Field']): [
-                str(col['Type'].decode('utf-8')),
-                str(col['Null']),
-                decodeDefault(col['Default']),
-                str(col['Extra'])
+            dField(col[0]): [
+                dType(col[1]),
+                dNull(col[2]),
+                dDefault(col[4]),
+                dExtra(col[5])
             ] for col in getTable
         }
 
-    def getCurrentDBStructure(self):
+    def hasQuotedColumnDefaults(self) -> bool:
+        """
+        Return True if the server is MariaDB 10.2.7 or later, where information_schema.COLUMNS.COLUMN_DEFAULT quotes
+        literal defaults and reports a missing default as the string 'NULL', unlike SHOW COLUMNS.
         """
-        Gather and return a dictionary representation of the current database structure.
+        if self._quotedDefaults is None:
+            versionRows = self.dbSelectTuples('SELECT VERSION();')[1]
+            version = columnDecoders(versionRows)[0](versionRows[0][0])
+            match = _MARIADB_VERSION_RE.search(version)
+            self._quotedDefaults = match is not None and tuple(int(x) for x in match.groups()) >= (10, 2, 7)
+        return self._quotedDefaults
+
+    def getCurrentDBStructure(self, useCache: bool = True):
+        """
+        Gather and return a dictionary representation of the current database structure.  The result is cached
+        until the structure is changed through this instance.
+        :param useCache: If False, always query the database, e.g. when the structure may have been changed
+        elsewhere.
         :return: {tableName: {colName: [type: str, notNull: 'YES'|'NO', default: str|None, extra: str], ...}, ...}
         """
-        return {table: self.getTableColumns(table) for table in self.fetchTableList()}
-
-    def createDataBackup(self, outputFolderPath: str):
+        if not useCache or self._structureCache is None:
+            # read every column of every table in one query instead of one SHOW COLUMNS per table
+            allColumns = self.dbSelectTuples(
+                'SELECT TABLE_NAME, COLUMN_NAME, COLUMN_TYPE, IS_NULLABLE, COLUMN_DEFAULT, EXTRA ' +
+                'FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = %s ORDER BY TABLE_NAME, ORDINAL_POSITION;',
+                (self.database,)
+            )[1]
+            dTable, dCol, dType, dNull, dDefault, dExtra = columnDecoders(allColumns) or [keepValue] * 6
+            # convert MariaDB defaults to the SHOW COLUMNS format used by the structure files
+            fixDefault = unquoteColumnDefault if self.hasQuotedColumnDefaults() else keepValue
+            structure = {}
+            for tName, colName, colType, nullable, default, extra in allColumns:
+                structure.setdefault(dTable(tName), {})[dCol(colName)] = [
+                    dType(colType),
+                    dNull(nullable),
+                    fixDefault(dDefault(default)),
+                    dExtra(extra)
+                ]
+            self._structureCache = structure
+        return self._structureCache
+
+    def createDataBackup(self, outputFolderPath: str, compresslevel: int = 1):
         """
         Create a backup of the data from all tables in the database.
         :param outputFolderPath: The name of the folder where the backup zip archive should be written. Path should
         end with a trailing slash.
+        :param compresslevel: zlib compression level (0-9) for the archive entries.  Defaults to 1 (fastest), which
+        is only slightly larger than the higher levels for CSV data.
         :return: The path to the backup zip archive.
         """
 
-        tableNames = self.fetchTableList()
+        # a backup is a snapshot of the database as it is now, including changes made by other clients
+        tableStructure = self.getCurrentDBStructure(useCache=False)
+        tableNames = list(tableStructure)
 
-        # create a backup of the database tables and structure
-        tableFiles = {'tableStructure': tempfile.TemporaryFile('w+')}
-
-        # write table structure to file
-        tableFiles['tableStructure'].write(json.dumps(self.getCurrentDBStructure()))
-        tableFiles['tableStructure'].seek(0)
-
-        # backup the data for each table file to the temp files (save to tmp to limit in-memory size)
-        for tName in tableNames:
-            # create temp files
-            tableFiles[tName] = tempfile.TemporaryFile('w+')
-
-            # fetch the data from the database
-            tableData = self.dbSelect(f'SELECT * FROM `{tName}`;')
-
-            # skip writing for empty tables
-            if len(tableData) == 0:
-                continue
-
-            # write the dictionary to the file
-            writer = csv.DictWriter(tableFiles[tName], fieldnames=list(dict.keys(tableData[0])))
-            writer.writeheader()
-            writer.writerows(tableData)
-            tableFiles[tName].seek(0)
-
-        # compile this table data into a single zip archive
         cTime = datetime.datetime.now()
         backupFileName = (f'backup_{cTime.year}{cTime.month:02d}{cTime.day:02d}_' +
                           f'{cTime.hour:02d}:{cTime.minute:02d}:{cTime.second:02d}.zip')
 
-        with zipfile.ZipFile(outputFolderPath + backupFileName, 'w') as f:
-            for tName in tableFiles:
-                f.writestr(tName, tableFiles[tName].read(), compress_type=zipfile.ZIP_DEFLATED)
-                tableFiles[tName].close()
-
-        return outputFolderPath + backupFileName
-
-    def restoreDataBackup(self, backupFilePath: str):
+        def dumpTable(tName: str):
+            """
+            Dump the rows of a table to a UTF-8 encoded CSV spool file, kept in memory unless the table is large.
+            The CSV text is encoded here in the worker, so the archive writer only has to copy bytes.
+            """
+            spool = tempfile.SpooledTemporaryFile(max_size=BACKUP_SPOOL_SIZE, mode='w+b')
+            spoolText = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+            with self.dbStream(f'SELECT * FROM {quoteIdentifier(tName)};') as (colNames, rows):
+                writer = csv.writer(spoolText)
+                writer.writerow(colNames)
+                writer.writerows(rows)
+            spoolText.flush()
+            spoolText.detach()
+            spool.seek(0)
+            return tName, spool
+
+        # write the archive under a temporary name and only give it the backup name once it is complete, so a
+        # failed backup does not leave a truncated archive that looks valid
+        backupPath = outputFolderPath + backupFileName
+        partialPath = backupPath + '.partial'
+        try:
+            # write the table structure and the data for each table into the zip archive
+            with zipfile.ZipFile(partialPath, 'w', compression=zipfile.ZIP_DEFLATED,
+                                 compresslevel=compresslevel) as f:
+                f.writestr('tableStructure', jsonDumps(tableStructure))
+
+                # dump the tables in parallel, each worker using its own pooled connection.  The archive is only
+                # written from this thread, compressing each table as soon as its dump completes.  At most
+                # BACKUP_MAX_PENDING dumps are queued, running or waiting to be compressed at once, which bounds the
+                # number of spool files held at the same time.
+                pendingTables = iter(tableNames)
+                pending = set()
+                with ThreadPoolExecutor(max_workers=max(1, min(BACKUP_WORKERS, len(tableNames)))) as executor:
+                    while True:
+                        for tName in itertools.islice(pendingTables, BACKUP_MAX_PENDING - len(pending)):
+                            pending.add(executor.submit(dumpTable, tName))
+                        if len(pending) == 0:
+                            break
+
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        for future in done:
+                            tName, spool = future.result()
+                            # copy in large blocks so zlib is fed few, large writes
+                            with spool, f.open(tName, 'w', force_zip64=True) as entry:
+                                shutil.copyfileobj(spool, entry, ZIP_WRITE_BUFFER_SIZE)
+        except BaseException:
+            if os.path.exists(partialPath):
+                os.remove(partialPath)
+            raise
+        os.replace(partialPath, backupPath)
+
+        return backupPath
+
+    def restoreDataBackup(self, backupFilePath: str, bulkLoad: bool = False):
         """
         Restore the database to the state described in the backup file.
 
         Scan for the tables and validate the columns, then delete all current entries and re-populate with the
-        data from the backup file.
+        data from the backup file.  The data is deleted and re-populated in a single transaction, so the previous
+        data is kept if the restore fails.
         :param backupFilePath: String path to the backup file from which to restore the database.
+        :param bulkLoad: If True, load the table data with LOAD DATA LOCAL INFILE, which is much faster than INSERT
+        for large tables.  Requires local_infile to be enabled on the server.
         """
         if not os.path.exists(backupFilePath):
             raise Exception('The provided backup file does not exist')
 
-        with tempfile.TemporaryDirectory() as tempDir:
-            # dump the zip archive to a temporary directory
-            with zipfile.ZipFile(backupFilePath, 'r') as backupArchive:
-                backupArchive.extractall(tempDir)
+        # read the entries straight from the archive instead of extracting it to disk first
+        with zipfile.ZipFile(backupFilePath, 'r') as backupArchive:
+            backupEntries = set(backupArchive.namelist())
 
-            tableStructurePath = tempDir + '/tableStructure'
-            if not os.path.exists(tableStructurePath):
+            if 'tableStructure' not in backupEntries:
                 raise Exception('The table structure file does not exist')
 
-            with open(tableStructurePath, 'r') as f:
-                targetTables = json.loads(f.read())
-
-            # validate that current structure matches the target structure
-            compareResult = self.compareDBToStructure(targetTables)
-            if len(compareResult['add']) != 0 or len(compareResult['edit']) != 0:
-                # perform changes to the database structure
-                self.applyChangesToDBStructure(compareResult)
+            targetTables = jsonLoads(backupArchive.read('tableStructure'))
 
-            # restore the data from the backup
+            # check the backup is complete before anything in the database is changed
             for table in targetTables:
-                if not os.path.exists(tempDir + '/' + table):
+                if table not in backupEntries:
                     raise Exception(f'Table `{table}` is missing from the backup files.')
 
-                self.dbQuery(f'DELETE FROM `{table}`;')
-
-                with open(tempDir + '/' + table, newline='') as csvfile:
-                    reader = csv.DictReader(csvfile)
-                    dataRows = [row for row in reader]
-                if len(dataRows) == 0:  # guard against empty tables
-                    print(f'Table `{table}` empty')
-                    continue
-
-                colsToInsert = ', '.join([f'`{x}`' for x in dataRows[0]])
-                valuePlaceholders = ', '.join(['%s'] * len(dataRows[0]))
-                insertDataQ = f'INSERT INTO `{table}` ({colsToInsert}) VALUES ({valuePlaceholders})'
-                idCursor = self.conn.cursor()
-                idCursor.executemany(
-                    insertDataQ,
-                    [dict.values(x) for x in dataRows]
-                )
-                print('Table restored:', table)
+            # validate that current structure matches the target structure, read fresh in case other clients have
+            # changed it
+            currentStructure = self.getCurrentDBStructure(useCache=False)
+            compareResult = self.compareDBToStructure(targetTables, currentStructure)
+            if len(compareResult['add']) != 0 or len(compareResult['edit']) != 0:
+                # perform changes to the database structure
+                self.applyChangesToDBStructure(compareResult, currentStructure)
+
+            # LOAD DATA LOCAL needs a connection created with local infile support, outside the pool
+            connOptions = {'allow_local_infile': True} if bulkLoad else {}
+
+            with self.getConn(**connOptions) as (conn, cur):
+                # the statement for a full batch is prepared once per table and re-executed for every batch
+                insertCur = conn.cursor(prepared=True)
+                try:
+                    # skip per-row unique and foreign key checks while the backup data is loaded.  Restored by
+                    # resetConn() when done.
+                    cur.execute('SET SESSION unique_checks = 0, foreign_key_checks = 0;')
+
+                    # restore the data from the backup in a single transaction.  Pooled connections only forward
+                    # method calls to the real connection, so the transaction is started explicitly rather than
+                    # by setting conn.autocommit.
+                    conn.start_transaction()
+                    for table in targetTables:
+                        # DELETE rather than TRUNCATE, which would commit implicitly and lose the old data on failure
+                        cur.execute(f'DELETE FROM {quoteIdentifier(table)};')
+
+                        if bulkLoad:
+                            # LOAD DATA LOCAL reads a file from disk, so extract just this table from the archive
+                            with tempfile.TemporaryDirectory() as tempDir:
+                                tablePath = backupArchive.extract(table, tempDir)
+                                # read the header, and count the data rows to verify the load against
+                                with open(tablePath, encoding='utf-8', newline='') as csvfile:
+                                    reader = csv.reader(csvfile)
+                                    header = next(reader, [])
+                                    rowCount = sum(1 for _ in reader)
+                                if len(header) == 0:  # guard against empty tables
+                                    print(f'Table `{table}` empty')
+                                    continue
+
+                                # load numeric columns through user variables so empty fields become NULL
+                                loadCols = []
+                                setCols = []
+                                for colId, colName in enumerate(header):
+                                    colType = (targetTables[table].get(colName) or ['text'])[0]
+                                    if _INT_TYPE_RE.match(colType) or _FLOAT_TYPE_RE.match(colType):
+                                        loadCols.append(f'@col{colId}')
+                                        setCols.append(f"{quoteIdentifier(colName)} = NULLIF(@col{colId}, '')")
+                                    else:
+                                        loadCols.append(quoteIdentifier(colName))
+
+                                # matches the dialect of csv.writer used by createDataBackup
+                                loadDataQ = (f'LOAD DATA LOCAL INFILE {quoteString(tablePath)} ' +
+                                             f'INTO TABLE {quoteIdentifier(table)} ' +
+                                             "CHARACTER SET utf8mb4 FIELDS TERMINATED BY ',' " +
+                                             "OPTIONALLY ENCLOSED BY '\"' ESCAPED BY '' " +
+                                             "LINES TERMINATED BY '\\r\\n' IGNORE 1 LINES (" +
+                                             ', '.join(loadCols) + ')')
+                                if len(setCols) != 0:
+                                    loadDataQ += ' SET ' + ', '.join(setCols)
+                                cur.execute(loadDataQ)
+
+                            # LOAD DATA LOCAL behaves as if IGNORE were given: duplicate rows are skipped and bad
+                            # values are coerced with a warning.  Fail instead, so the transaction is rolled back
+                            # like it is when an INSERT fails.
+                            loadedCount = cur.rowcount
+                            warningCount = cur.warning_count
+                            if warningCount != 0 or loadedCount != rowCount:
+                                cur.execute('SHOW WARNINGS LIMIT 5;')
+                                warningText = '; '.join(str(w[2]) for w in cur.fetchall())
+                                raise Exception(f'Table `{table}` was not loaded cleanly: {loadedCount} of ' +
+                                                f'{rowCount} rows loaded with {warningCount} warnings. ' +
+                                                warningText)
+                            if loadedCount == 0:
+                                print(f'Table `{table}` empty')
+                                continue
+                            print('Table restored:', table)
+                            continue
+
+                        # stream the rows from the archive in batches instead of reading the whole table into memory
+                        with backupArchive.open(table) as rawEntry, \
+                                io.TextIOWrapper(rawEntry, encoding='utf-8', newline='') as csvfile:
+                            reader = csv.reader(csvfile)
+                            header = next(reader, [])
+                            if len(header) == 0:  # guard against empty tables
+                                print(f'Table `{table}` empty')
+                                continue
+
+                            colsToInsert = ', '.join([quoteIdentifier(x) for x in header])
+                            rowPlaceholder = '(' + ', '.join(['%s'] * len(header)) + ')'
+                            # convert the CSV text of numeric columns to python numbers so the server does not have
+                            # to coerce them.  The other columns are sent as the str values from the reader.
+                            converters = [(colId, csvValueConverter((targetTables[table].get(x) or ['text'])[0]))
+                                          for colId, x in enumerate(header)]
+                            converters = [(colId, conv) for colId, conv in converters if conv is not str]
+
+                            def convertRow(row: list) -> list:
+                                for convColId, conv in converters:
+                                    row[convColId] = conv(row[convColId])
+                                return row
+
+                            rowValues = map(convertRow, reader) if len(converters) != 0 else reader
+
+                            # send the rows as multi-row INSERT statements, keeping within the placeholder limit of
+                            # a prepared statement
+                            batchSize = max(1, min(INSERT_BATCH_SIZE, PREPARED_PARAM_LIMIT // len(header)))
+                            insertPrefix = f'INSERT INTO {quoteIdentifier(table)} ({colsToInsert}) VALUES '
+                            fullBatchQ = insertPrefix + ', '.join([rowPlaceholder] * batchSize)
+                            rowCount = 0
+                            for batch in iter(lambda: list(itertools.islice(rowValues, batchSize)), []):
+                                if len(batch) == batchSize:
+                                    insertDataQ = fullBatchQ
+                                else:
+                                    insertDataQ = insertPrefix + ', '.join([rowPlaceholder] * len(batch))
+                                insertCur.execute(insertDataQ, list(itertools.chain.from_iterable(batch)))
+                                rowCount += len(batch)
+                        if rowCount == 0:
+                            print(f'Table `{table}` empty')
+                            continue
+                        print('Table restored:', table)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                finally:
+                    insertCur.close()
+                    self.resetConn(conn)
         print('Database restored from backup:', backupFilePath)
 
-    def compareDBToStructure(self, targetStructure: dict):
+    def compareDBToStructure(self, targetStructure: dict, currentStructure: dict = None):
         """
         Create a description of changes needed for the database to conform to the target structure.
         :param targetStructure: Dictionary describing the target structure. Format:
@@ -237,93 +578,97 @@ class DBConn:
         :return: {add: dict, edit: dict} where add and remove dicts follow format:
             {tableName: '' | {colName: '' | targetStructureCol}, ...}  if edit[tableName] == '' then remove the table.
             if edit[tableName][colName] == '' remove the column.  if colName is targetStructureCol, update the column.
+        :param currentStructure: The structure to compare against, from getCurrentDBStructure().  Fetched if not
+        provided.
         """
 
         # load the current table list, including columns
-        currentStructure = self.getCurrentDBStructure()
+        if currentStructure is None:
+            currentStructure = self.getCurrentDBStructure()
 
         dbDiff = {'add': {}, 'edit': {}}
 
-        # find tables and columns to be removed
-        for tableName in list(dict.keys(currentStructure)):
-            # check if table need to be removed
+        # fast path for the common case of restoring into the structure the backup was taken from
+        if currentStructure == targetStructure:
+            return dbDiff
+
+        # remove tables missing from the target structure, in the current structure's order so the DROP TABLE
+        # statements run in the same order on every run
+        for tableName in currentStructure:
             if tableName not in targetStructure:
                 dbDiff['edit'][tableName] = ''
-                continue
-
-            dbDiff['edit'][tableName] = {}
-
-            # check if columns need to be removed
-            for colName in list(dict.keys(currentStructure[tableName])):
-                # check if column needs to be removed
-                if colName not in targetStructure[tableName]:
-                    dbDiff['edit'][tableName][colName] = ''
-
-                elif currentStructure[tableName][colName] != targetStructure[tableName][colName]:
-                    # mark column as 'needs edit' to conform
-                    dbDiff['edit'][tableName][colName] = targetStructure[tableName][colName]
-
-            # remove table key from edit if no edits are needed
-            if len(dbDiff['edit'][tableName]) == 0:
-                del dbDiff['edit'][tableName]
 
-        # find tables that need to be added
-        for tableName in list(dict.keys(targetStructure)):
+        for tableName, targetCols in targetStructure.items():
             # add complete missing tables
             if tableName not in currentStructure:
-                dbDiff['add'][tableName] = targetStructure[tableName]
+                dbDiff['add'][tableName] = targetCols
                 continue
 
-            # add only missing columns
-            dbDiff['add'][tableName] = {}
-            for colName in list(dict.keys(targetStructure[tableName])):
-                if colName not in currentStructure[tableName]:
-                    dbDiff['add'][tableName][colName] = targetStructure[tableName][colName]
+            currentCols = currentStructure[tableName]
+
+            # remove columns missing from the target, and edit the common columns which differ.  Iterated in the
+            # current column order so the generated ALTER TABLE is the same on every run.
+            colEdits = {}
+            for colName, colData in currentCols.items():
+                if colName not in targetCols:
+                    colEdits[colName] = ''
+                elif colData != targetCols[colName]:
+                    colEdits[colName] = targetCols[colName]
+            if len(colEdits) != 0:
+                dbDiff['edit'][tableName] = colEdits
 
-            # remove table key from edit if no additions are needed
-            if len(dbDiff['add'][tableName]) == 0:
-                del dbDiff['add'][tableName]
+            # add only missing columns, in target order since added columns are appended to the table
+            colAdds = {colName: colData for colName, colData in targetCols.items() if colName not in currentCols}
+            if len(colAdds) != 0:
+                dbDiff['add'][tableName] = colAdds
 
         return dbDiff
 
-    def applyChangesToDBStructure(self, dbDelta: dict):
+    def applyChangesToDBStructure(self, dbDelta: dict, currentStructure: dict = None):
         """
         Applies changes to the database structure specified by [dbDela].  dbDelta format comes from output of the
         function compareDBToStructure()
         :param dbDelta: Dictionary describing changes needed for database structure. Format from compareDBToStructure():
             {tableName: '' | {colName: '' | targetStructureCol}, ...}  if edit[tableName] == '' then remove the table.
             if edit[tableName][colName] == '' remove the column.  if colName is targetStructureCol, update the column.}
+        :param currentStructure: The structure dbDelta was computed against, from getCurrentDBStructure().  Fetched
+        if not provided.
         """
 
-        currentStructure = self.getCurrentDBStructure()
+        if currentStructure is None:
+            currentStructure = self.getCurrentDBStructure()
+        # the structure is about to change
+        self._structureCache = None
 
         def buildColModSQL(nameOfCol: str, cData: list):
             """ Build the SQL used to create a column. """
             b_nullText = '' if cData[1] == 'YES' else 'NOT'
-            b_defaultText = '' if cData[2] is None else f'DEFAULT \'{cData[2]}\''
-            return f'`{nameOfCol}` {cData[0]} {b_defaultText} {cData[3]} {b_nullText} NULL'
+            b_defaultText = '' if cData[2] is None else f'DEFAULT {quoteString(cData[2])}'
+            return f'{quoteIdentifier(nameOfCol)} {cData[0]} {b_defaultText} {cData[3]} {b_nullText} NULL'
+
+        # column changes are collected per table and applied with one ALTER TABLE, so the table is rebuilt at most once
+        alterClauses = {}
 
         # process edits and deletions
         for tableName in dbDelta['edit']:
             if dbDelta['edit'][tableName] == '':
-                self.dbQuery(f'DROP TABLE `{tableName}`;')
+                self.dbQuery(f'DROP TABLE {quoteIdentifier(tableName)};')
                 continue
 
             for colName in dbDelta['edit'][tableName]:
                 if dbDelta['edit'][tableName][colName] == '':
-                    self.dbQuery(f'ALTER TABLE `{tableName}` DROP COLUMN `{colName}`;')
+                    alterClauses.setdefault(tableName, []).append(f'DROP COLUMN {quoteIdentifier(colName)}')
                 else:
-                    editColQ = f'ALTER TABLE `{tableName}` MODIFY COLUMN ' + buildColModSQL(
+                    alterClauses.setdefault(tableName, []).append('MODIFY COLUMN ' + buildColModSQL(
                         colName,
                         dbDelta['edit'][tableName][colName]
-                    )
-                    self.dbQuery(editColQ)
+                    ))
 
         # process table and column additions
         for tableName in dbDelta['add']:
             if tableName not in currentStructure:
                 # add entire table + columns
-                createTableQ = f'CREATE TABLE `{tableName}` ('
+                createTableQ = f'CREATE TABLE {quoteIdentifier(tableName)} ('
 
                 hadAutoIncrement = ''
                 for colName in dbDelta['add'][tableName]:
@@ -339,18 +684,18 @@ class DBConn:
 
                 # add primary key for the auto increment column.
                 if hadAutoIncrement != '':
-                    createTableQ += f', PRIMARY KEY (`{hadAutoIncrement}`)'
+                    createTableQ += f', PRIMARY KEY ({quoteIdentifier(hadAutoIncrement)})'
 
                 createTableQ += ') ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_general_ci;'
                 self.dbQuery(createTableQ)
                 continue
 
             # add only missing columns
-            for colName in list(dict.keys(dbDelta['add'][tableName])):
-
-                addColQ = f'ALTER TABLE `{tableName}` ADD ' + buildColModSQL(
+            for colName in dbDelta['add'][tableName]:
+                alterClauses.setdefault(tableName, []).append('ADD ' + buildColModSQL(
                     colName,
                     dbDelta['add'][tableName][colName]
-                )
-                self.dbQuery(addColQ)
+                ))
 
+        for tableName, clauses in alterClauses.items():
+            self.dbQuery(f'ALTER TABLE {quoteIdentifier(tableName)} ' + ', '.join(clauses) + ';')